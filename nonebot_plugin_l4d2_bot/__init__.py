@@ -1,12 +1,14 @@
 import functools
+import importlib.util
 
 from nonebot import get_driver, get_plugin_config
+from nonebot.log import logger
 from nonebot.plugin import PluginMetadata
 
 from .config import BridgeConfig, init_config
 from .ws_server import setup_ws_server
 from .http_server import setup_http_server
-from .forwarder import setup_forwarder
+from .forwarder import setup_forwarder, shutdown_forwarder
 
 __plugin_meta__ = PluginMetadata(
     name="L4D2 Bot",
@@ -28,6 +30,11 @@ _original_run = driver.run
 @functools.wraps(_original_run)
 def _patched_run(*args, **kwargs):
     kwargs.setdefault("ws_max_size", _config.l4d2_bot_ws_max_size)
+    if _config.l4d2_bot_uvloop:
+        if importlib.util.find_spec("uvloop"):
+            kwargs.setdefault("loop", "uvloop")
+        else:
+            logger.warning("未安装 uvloop，使用默认事件循环")
     _original_run(*args, **kwargs)
 
 
@@ -40,3 +47,8 @@ async def _startup():
     setup_ws_server()
     setup_http_server()
     setup_forwarder()
+
+
+@driver.on_shutdown
+async def _shutdown():
+    await shutdown_forwarder()
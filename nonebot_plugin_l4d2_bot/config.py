@@ -18,6 +18,7 @@ class BridgeConfig(BaseModel):
     l4d2_bot_hmac_window_sec: int = 30
     l4d2_bot_msg_dedup_window_sec: int = 600
     l4d2_bot_ws_max_size: int = 8 * 1024 * 1024
+    l4d2_bot_uvloop: bool = False
 
     def display_name(self, server_id: str) -> str:
         return self.l4d2_bot_server_names.get(server_id, server_id)
@@ -32,6 +33,14 @@ class BridgeConfig(BaseModel):
             self._ul_path = p
         return self._ul_path
 
+    _qq_group_set: frozenset[str] | None = PrivateAttr(default=None)
+
+    @property
+    def qq_group_set(self) -> frozenset[str]:
+        if self._qq_group_set is None:
+            self._qq_group_set = frozenset(self.l4d2_bot_qq_groups)
+        return self._qq_group_set
+
 
 _config: BridgeConfig | None = None
 
@@ -1,52 +1,107 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import time
 
 from nonebot.log import logger
 from .protocol import BridgePacket
 
+_OUT_QUEUE_SIZE = 1024
+_SEND_TIMEOUT = 5.0
+_BATCH_MAX_BYTES = 64 * 1024
+
 
 class GameServerConn:
     __slots__ = ("server_id", "ws", "connected_at", "last_ping",
-                 "authenticated", "_send_lock")
+                 "authenticated", "batch", "out_q", "_writer_task")
 
     def __init__(self, server_id: str, ws):
         self.server_id = server_id
         self.ws = ws
-        self.connected_at = time.time()
-        self.last_ping = time.time()
+        self.connected_at = self.last_ping = time.monotonic()
         self.authenticated = False
-        self._send_lock = asyncio.Lock()
+        self.batch = False
+        self.out_q: asyncio.Queue[str] = asyncio.Queue(maxsize=_OUT_QUEUE_SIZE)
+        self._writer_task = asyncio.create_task(self._writer())
 
     async def send_packet(self, pkt: BridgePacket):
-        async with self._send_lock:
+        await self.send_text(pkt.to_json())
+
+    async def send_text(self, raw: str):
+        if self.send_nowait(raw):
+            return
+        try:
+            await asyncio.wait_for(self.out_q.put(raw), timeout=_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"发送队列已满，断开慢速连接: {self.server_id}")
+            await self.close()
+            raise
+
+    def send_nowait(self, raw: str) -> bool:
+        if self._writer_task.done():
+            raise ConnectionError(f"连接已关闭: {self.server_id}")
+        try:
+            self.out_q.put_nowait(raw)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def close(self):
+        self.stop()
+        with contextlib.suppress(Exception):
+            await self.ws.close()
+
+    def stop(self):
+        self._writer_task.cancel()
+
+    async def _writer(self):
+        while True:
+            raw = await self.out_q.get()
+            if self.batch and not self.out_q.empty():
+                raw = self._drain_batch(raw)
             try:
-                await self.ws.send_text(pkt.model_dump_json())
+                await self.ws.send_text(raw)
             except Exception as e:
                 logger.error(f"发送数据包到 {self.server_id} 失败: {e}")
-                raise
+                with contextlib.suppress(Exception):
+                    await self.ws.close()
+                return
+
+    def _drain_batch(self, first: str) -> str:
+        batch = [first]
+        size = len(first)
+        while size < _BATCH_MAX_BYTES and not self.out_q.empty():
+            raw = self.out_q.get_nowait()
+            batch.append(raw)
+            size += len(raw) + 1
+        return "[" + ",".join(batch) + "]"
 
     @property
     def alive_seconds(self) -> float:
-        return time.time() - self.connected_at
+        return time.monotonic() - self.connected_at
 
 
 class ConnectionManager:
 
     def __init__(self):
         self._conns: dict[str, GameServerConn] = {}
+        self._snapshot: tuple[tuple[str, GameServerConn], ...] = ()
 
     def add(self, server_id: str, ws) -> GameServerConn:
-        if server_id in self._conns:
+        if (old := self._conns.get(server_id)) is not None:
             logger.warning(f"覆盖已有连接: {server_id}")
+            old.stop()
         conn = GameServerConn(server_id, ws)
         self._conns[server_id] = conn
+        self._snapshot = tuple(self._conns.items())
         logger.info(f"服务器已连接: {server_id}")
         return conn
 
     def remove(self, server_id: str):
-        if self._conns.pop(server_id, None) is not None:
+        if (conn := self._conns.pop(server_id, None)) is not None:
+            conn.stop()
+            self._snapshot = tuple(self._conns.items())
             logger.info(f"服务器已断开: {server_id}")
 
     def get(self, server_id: str) -> GameServerConn | None:
@@ -63,13 +118,37 @@ class ConnectionManager:
         return len(self._conns)
 
     async def broadcast(self, pkt: BridgePacket, exclude: str = ""):
-        for sid, conn in list(self._conns.items()):
-            if sid == exclude or not conn.authenticated:
-                continue
+        targets = [
+            (sid, conn) for sid, conn in self._snapshot
+            if sid != exclude and conn.authenticated
+        ]
+        if not targets:
+            return
+
+        raw = pkt.to_json()
+        dead: list[tuple[str, GameServerConn]] = []
+        backlog: list[tuple[str, GameServerConn]] = []
+        for sid, conn in targets:
             try:
-                await conn.send_packet(pkt)
+                if not conn.send_nowait(raw):
+                    backlog.append((sid, conn))
             except Exception as e:
-                logger.error(f"广播到 {sid} 失败: {e}")
+                logger.error(f"广播到 {sid} 失败: {e!r}")
+                dead.append((sid, conn))
+
+        if backlog:
+            results = await asyncio.gather(
+                *(conn.send_text(raw) for _, conn in backlog),
+                return_exceptions=True)
+            for (sid, conn), result in zip(backlog, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"广播到 {sid} 失败: {result!r}")
+                    dead.append((sid, conn))
+
+        # A server may have reconnected while the backlog was awaited; only
+        # drop the connection that actually failed.
+        for sid, conn in dead:
+            if self._conns.get(sid) is conn:
                 self.remove(sid)
 
 
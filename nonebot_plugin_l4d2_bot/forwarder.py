@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import re
 from pathlib import Path, PurePosixPath
+from typing import Any
 from urllib.parse import urlparse, unquote
 
 import aiofiles
@@ -12,14 +15,20 @@ from nonebot.adapters.onebot.v11 import (
     GroupMessageEvent, GroupUploadNoticeEvent, Message,
 )
 from nonebot.rule import Rule
+from nonebot.typing import T_State
 
 from .config import get_config
 from nonebot.log import logger
 from .connection import conn_mgr
-from .protocol import make_file_in_notice
+from .protocol import BridgePacket, make_file_in_notice
 from .ws_server import on_file_out, on_result
 from .http_server import get_file_meta, safe_filename
 
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+_HEAD_TIMEOUT = 10
+
+_http: httpx.AsyncClient | None = None
+
 _URL_RE = re.compile(r'https?://[^\s"<>\]\)}{,]+', re.IGNORECASE)
 
 _FLASH_RE = re.compile(
@@ -34,7 +43,7 @@ _FLASH_RE = re.compile(
 
 def _is_bridge_group() -> Rule:
     async def checker(event: GroupMessageEvent) -> bool:
-        return str(event.group_id) in get_config().l4d2_bot_qq_groups
+        return str(event.group_id) in get_config().qq_group_set
     return Rule(checker)
 
 
@@ -45,16 +54,30 @@ def _starts_with_download() -> Rule:
     return Rule(checker)
 
 
+def _find_fileset_id(message: Message) -> str:
+    for seg in message:
+        if seg.type == "flashtransfer":
+            return seg.data.get("fileSetId", "")
+    for seg in message:
+        if seg.type == "text" and (m := _FLASH_RE.search(seg.data.get("text", ""))):
+            return m.group(1) or m.group(2)
+    return ""
+
+
 def _has_flash_segment() -> Rule:
-    async def checker(event: GroupMessageEvent) -> bool:
-        for seg in event.message:
-            if seg.type == "flashtransfer":
-                return True
-        return bool(_FLASH_RE.search(str(event.get_message())))
+    async def checker(event: GroupMessageEvent, state: T_State) -> bool:
+        state["fileset_id"] = _find_fileset_id(event.message)
+        return bool(state["fileset_id"])
     return Rule(checker)
 
 
 def setup_forwarder():
+    global _http
+    _http = httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=httpx.Timeout(600, connect=30),
+        limits=httpx.Limits(max_keepalive_connections=20),
+    )
     _register_game_to_bot_handlers()
 
     grp = _is_bridge_group()
@@ -68,6 +91,13 @@ def setup_forwarder():
     upload_notice.handle()(_handle_group_upload)
 
 
+async def shutdown_forwarder():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
 def _filename_from_url(url: str, fallback: str = "download") -> str:
     try:
         name = PurePosixPath(unquote(urlparse(url).path)).name
@@ -84,7 +114,7 @@ def _sender_name(event: GroupMessageEvent) -> str:
 
 async def _handle_group_upload(bot: Bot, event: GroupUploadNoticeEvent):
     cfg = get_config()
-    if str(event.group_id) not in cfg.l4d2_bot_qq_groups:
+    if str(event.group_id) not in cfg.qq_group_set:
         return
 
     if str(event.user_id) == str(bot.self_id):
@@ -130,17 +160,10 @@ async def _handle_group_upload(bot: Bot, event: GroupUploadNoticeEvent):
         pass
 
 
-async def _handle_flash_message(bot: Bot, event: GroupMessageEvent):
-    fileset_id = ""
-    for seg in event.message:
-        if seg.type == "flashtransfer":
-            fileset_id = seg.data.get("fileSetId", "")
-            break
+async def _handle_flash_message(bot: Bot, event: GroupMessageEvent, state: T_State):
+    fileset_id = state.get("fileset_id") or _find_fileset_id(event.message)
     if not fileset_id:
-        m = _FLASH_RE.search(str(event.get_message()))
-        if not m:
-            return
-        fileset_id = m.group(1) or m.group(2)
+        return
 
     logger.info(f"检测到闪传: fileSetId={fileset_id}")
 
@@ -173,34 +196,45 @@ async def _handle_flash_message(bot: Bot, event: GroupMessageEvent):
     cfg = get_config()
     channel = f"qq_group:{event.group_id}"
 
-    for f in vpk_files:
-        file_name = f.get("file_name", "download.vpk")
-        try:
-            url_resp = await bot.call_api(
-                "get_flash_file_url", fileset_id=fileset_id, file_name=file_name)
-        except Exception as e:
-            logger.error(f"获取闪传文件URL失败: {e}")
-            await bot.send(event, f"闪传文件URL获取失败: {e}")
-            continue
+    names = [f.get("file_name", "download.vpk") for f in vpk_files]
+    results = await asyncio.gather(
+        *(_get_flash_file_url(bot, fileset_id, name) for name in names),
+        return_exceptions=True)
 
-        file_url = ""
-        if isinstance(url_resp, str):
-            file_url = url_resp
-        elif isinstance(url_resp, dict):
-            file_url = url_resp.get("transferUrl", "") or url_resp.get("url", "")
-        if not file_url:
-            logger.warning(f"闪传文件URL为空: {file_name}, resp={url_resp}")
+    pushed: list[tuple[str, BridgePacket]] = []
+    for f, file_name, result in zip(vpk_files, names, results):
+        if isinstance(result, Exception):
+            logger.error(f"获取闪传文件URL失败: {result}")
+            await bot.send(event, f"闪传文件URL获取失败: {result}")
+            continue
+        if not result:
             continue
 
         logger.info(f"闪传链接推送: {file_name} from {_sender_name(event)}")
-        pkt = make_file_in_notice(
+        pushed.append((file_name, make_file_in_notice(
             channel=channel, file_name=file_name,
-            secret=cfg.l4d2_bot_token, url=file_url,
-            size=f.get("size", 0))
-        await conn_mgr.broadcast(pkt)
+            secret=cfg.l4d2_bot_token, url=result,
+            size=f.get("size", 0))))
+
+    await asyncio.gather(*(conn_mgr.broadcast(pkt) for _, pkt in pushed))
+    for file_name, _ in pushed:
         await bot.send(event, f"推送服务端\n文件: {file_name}")
 
 
+async def _get_flash_file_url(bot: Bot, fileset_id: str, file_name: str) -> str:
+    url_resp = await bot.call_api(
+        "get_flash_file_url", fileset_id=fileset_id, file_name=file_name)
+
+    file_url = ""
+    if isinstance(url_resp, str):
+        file_url = url_resp
+    elif isinstance(url_resp, dict):
+        file_url = url_resp.get("transferUrl", "") or url_resp.get("url", "")
+    if not file_url:
+        logger.warning(f"闪传文件URL为空: {file_name}, resp={url_resp}")
+    return file_url
+
+
 async def _handle_download_cmd(bot: Bot, event: GroupMessageEvent):
     raw = event.get_plaintext().strip().removeprefix("下载").strip()
     urls = _URL_RE.findall(raw)
@@ -215,36 +249,44 @@ async def _handle_download_cmd(bot: Bot, event: GroupMessageEvent):
     cfg = get_config()
     channel = f"qq_group:{event.group_id}"
 
-    for url in urls:
+    sizes = await asyncio.gather(*(_head_size(url) for url in urls))
+
+    pushed: list[tuple[str, BridgePacket]] = []
+    for url, file_size in zip(urls, sizes):
         file_name = _filename_from_url(url)
-        file_size = 0
-        try:
-            async with httpx.AsyncClient(follow_redirects=True, timeout=10) as cli:
-                resp = await cli.head(url)
-                file_size = int(resp.headers.get("content-length", 0))
-        except Exception:
-            pass
         logger.info(f"直链推送: {file_name} from {_sender_name(event)}")
-        pkt = make_file_in_notice(
+        pushed.append((file_name, make_file_in_notice(
             channel=channel, file_name=file_name,
             secret=cfg.l4d2_bot_token, url=url,
-            size=file_size)
-        await conn_mgr.broadcast(pkt)
+            size=file_size)))
+
+    await asyncio.gather(*(conn_mgr.broadcast(pkt) for _, pkt in pushed))
+    for file_name, _ in pushed:
         await bot.send(event, f"推送服务端\n文件: {file_name}")
 
 
+async def _head_size(url: str) -> int:
+    try:
+        resp = await _http.head(url, timeout=_HEAD_TIMEOUT)
+        return int(resp.headers.get("content-length", 0))
+    except Exception:
+        return 0
+
+
 def _register_game_to_bot_handlers():
 
     @on_result
     async def _download_result_to_qq(
             server_id: str, ok: bool, file_name: str,
-            size_mb: str, speed: str, err_msg: str,
-            extracted: str = "", extract_time: str = "", channel: str = ""):
+            size_mb: Any, speed: Any, err_msg: str,
+            extracted: bool = False, extract_time: Any = "",
+            channel: str = ""):
         gids = _resolve_target_gids(channel)
-        if extracted == "true":
-            msg = f"解压完成\n文件: {file_name}\n耗时: {extract_time}S"
+        if extracted:
+            msg = f"解压完成\n文件: {file_name}\n耗时: {_fmt_num(extract_time)}S"
         elif ok:
-            msg = f"下载完成\n文件: {file_name}\n大小: {size_mb} MB\n速率: {speed} MB/S"
+            msg = (f"下载完成\n文件: {file_name}\n大小: {_fmt_num(size_mb)} MB"
+                   f"\n速率: {_fmt_num(speed)} MB/S")
         else:
             msg = f"下载失败\n文件: {file_name}\n原因: {err_msg}"
         await _broadcast_text(msg, gids)
@@ -259,7 +301,7 @@ def _register_game_to_bot_handlers():
         safe_name = safe_filename(file_name)
         display = cfg.display_name(server_id)
 
-        resolved = await _resolve_file_path(url, file_id, safe_name, cfg)
+        resolved = await _resolve_file_path(url, file_id, safe_name, cfg, sha256)
         if not resolved:
             reason = "下载失败" if url else "文件不可用"
             await _broadcast_text(f"{display}上传文件: {file_name} {reason}", gids)
@@ -277,17 +319,23 @@ def _register_game_to_bot_handlers():
 
 
 async def _resolve_file_path(
-        url: str, file_id: str, safe_name: str, cfg) -> str | None:
+        url: str, file_id: str, safe_name: str, cfg,
+        sha256: str = "") -> str | None:
     if url:
         save_path = cfg.upload_path / safe_name
+        hasher = hashlib.sha256()
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(600, connect=30)) as client:
-                async with client.stream("GET", url) as resp:
-                    resp.raise_for_status()
-                    async with aiofiles.open(save_path, "wb") as f:
-                        async for chunk in resp.aiter_bytes(chunk_size=65536):
-                            await f.write(chunk)
+            async with _http.stream("GET", url) as resp:
+                resp.raise_for_status()
+                async with aiofiles.open(save_path, "wb") as f:
+                    async for chunk in resp.aiter_bytes(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                        hasher.update(chunk)
+                        await f.write(chunk)
             logger.info(f"文件已下载: {save_path}")
+            actual_sha = hasher.hexdigest()
+            if sha256 and actual_sha != sha256:
+                logger.warning(f"SHA256 不匹配: "
+                              f"期望={sha256} 实际={actual_sha}")
             return str(save_path.resolve())
         except Exception as e:
             logger.error(f"下载文件失败: {e}")
@@ -300,11 +348,17 @@ async def _resolve_file_path(
     return str(Path(meta["path"]).resolve())
 
 
+def _fmt_num(v: Any) -> str:
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return f"{v:.2f}"
+    return str(v)
+
+
 def _resolve_target_gids(channel: str | None) -> list[str]:
     cfg = get_config()
     if channel and channel.startswith("qq_group:"):
         gid = channel.removeprefix("qq_group:").strip()
-        if gid.isdigit() and gid in cfg.l4d2_bot_qq_groups:
+        if gid.isdigit() and gid in cfg.qq_group_set:
             return [gid]
     return list(cfg.l4d2_bot_qq_groups)
 
@@ -331,10 +385,12 @@ async def _broadcast_file(file_path: str, file_name: str, gids: list[str]):
     bot = _get_bot()
     if not bot:
         return
-    for gid in gids:
-        try:
-            await bot.call_api(
-                "upload_group_file", group_id=int(gid),
-                file=file_path, name=file_name)
-        except Exception as e:
-            logger.error(f"发送文件到群 {gid} 失败: {e}")
+    results = await asyncio.gather(*(
+        bot.call_api(
+            "upload_group_file", group_id=int(gid),
+            file=file_path, name=file_name)
+        for gid in gids
+    ), return_exceptions=True)
+    for gid, result in zip(gids, results):
+        if isinstance(result, Exception):
+            logger.error(f"发送文件到群 {gid} 失败: {result}")
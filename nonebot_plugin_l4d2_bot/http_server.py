@@ -2,17 +2,22 @@ from __future__ import annotations
 
 import hashlib
 import hmac
-import json
+import os
 import re
 import time
 import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
 from pathlib import Path
-from urllib.parse import parse_qs, urlparse
 
 import aiofiles
+import orjson
 from nonebot import get_driver
 from nonebot.drivers import ASGIMixin, HTTPServerSetup, Request, Response
-from starlette.requests import URL
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import URL, Request as StarletteRequest
+from starlette.responses import FileResponse, Response as StarletteResponse
 
 from .config import get_config
 from nonebot.log import logger
@@ -20,8 +25,17 @@ from nonebot.log import logger
 _FILE_ID_RE = re.compile(r'^[0-9a-f]{1,32}$')
 _MAX_REGISTRY_SIZE = 500
 _REGISTRY_TTL = 3600
+_CLEANUP_INTERVAL = 60
+_WRITE_CHUNK_SIZE = 1 << 20
+_SAFE_NAME_TABLE = str.maketrans(
+    {c: "_" for c in [*map(chr, range(0x20)), *'/\\:*?"<>|']})
+_MAX_NAME_BYTES = 255
+_MAX_PART_HEADER = 16 * 1024
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
 
-_file_registry: dict[str, dict] = {}
+_file_registry: OrderedDict[str, dict] = OrderedDict()
+_list_cache: bytes | None = None
+_last_cleanup = 0.0
 
 
 def get_file_meta(file_id: str) -> dict | None:
@@ -29,23 +43,35 @@ def get_file_meta(file_id: str) -> dict | None:
 
 
 def register_file(file_id: str, meta: dict):
+    global _list_cache
     meta["_registered_at"] = time.time()
     _file_registry[file_id] = meta
+    _file_registry.move_to_end(file_id)
+    _list_cache = None
     _cleanup_registry()
 
 
+def _unregister_file(file_id: str):
+    global _list_cache
+    if _file_registry.pop(file_id, None) is not None:
+        _list_cache = None
+
+
 def _cleanup_registry():
+    global _last_cleanup
     if len(_file_registry) <= _MAX_REGISTRY_SIZE:
         return
-    now = time.time()
-    expired = [k for k, v in _file_registry.items()
-               if now - v.get("_registered_at", 0) > _REGISTRY_TTL]
-    for k in expired:
-        del _file_registry[k]
-    if len(_file_registry) > _MAX_REGISTRY_SIZE:
-        oldest = sorted(_file_registry, key=lambda k: _file_registry[k].get("_registered_at", 0))
-        for k in oldest[:len(_file_registry) - _MAX_REGISTRY_SIZE]:
-            del _file_registry[k]
+    mono = time.monotonic()
+    if mono - _last_cleanup >= _CLEANUP_INTERVAL:
+        _last_cleanup = mono
+        now = time.time()
+        while _file_registry:
+            oldest = next(iter(_file_registry.values()))
+            if now - oldest.get("_registered_at", 0) <= _REGISTRY_TTL:
+                break
+            _file_registry.popitem(last=False)
+    while len(_file_registry) > _MAX_REGISTRY_SIZE:
+        _file_registry.popitem(last=False)
 
 
 def setup_http_server():
@@ -56,11 +82,18 @@ def setup_http_server():
         return
 
     base = cfg.l4d2_bot_file_path
-    for method, suffix, name, handler in (
-        ("POST", "/upload",   "l4d2_bot_upload",    _handle_upload),
-        ("GET",  "/download", "l4d2_bot_download",  _handle_download),
-        ("GET",  "/list",     "l4d2_bot_file_list", _handle_list),
+    app = driver.server_app
+    for method, suffix, name, handler, stream_handler in (
+        ("POST", "/upload",   "l4d2_bot_upload",    _handle_upload,
+         _handle_upload_stream),
+        ("GET",  "/download", "l4d2_bot_download",  _handle_download,
+         _handle_download_stream),
+        ("GET",  "/list",     "l4d2_bot_file_list", _handle_list, None),
     ):
+        if stream_handler and isinstance(app, Starlette):
+            app.add_route(f"{base}{suffix}", stream_handler,
+                          methods=[method], name=name)
+            continue
         driver.setup_http_server(HTTPServerSetup(
             path=URL(f"{base}{suffix}"), method=method,
             name=name, handle_func=handler))
@@ -68,12 +101,18 @@ def setup_http_server():
     logger.info(f"HTTP 文件端点已挂载: {base}")
 
 
+def _query_param(request, key: str) -> str:
+    params = getattr(request, "query_params", None)
+    if params is None:
+        params = request.url.query
+    return params.get(key, "")
+
+
 def _check_auth(request: Request) -> bool:
     auth = request.headers.get("authorization", "")
     if auth.startswith("Bearer "):
         return hmac.compare_digest(auth[7:], get_config().l4d2_bot_token)
-    qs = parse_qs(urlparse(str(request.url)).query)
-    token = qs.get("token", [""])[0]
+    token = _query_param(request, "token")
     if token:
         return hmac.compare_digest(token, get_config().l4d2_bot_token)
     return False
@@ -85,52 +124,136 @@ def _check_extension(filename: str) -> bool:
 
 
 def safe_filename(filename: str) -> str:
-    name = Path(filename).name
-    name = re.sub(r'[\x00-\x1f/\\:*?"<>|]', '_', name)
-    while '..' in name:
-        name = name.replace('..', '')
-    name = name.strip('. ')
+    name = Path(filename).name.translate(_SAFE_NAME_TABLE)
+    name = name.replace('..', '_').strip('. ')
+    if len(raw := name.encode()) > _MAX_NAME_BYTES:
+        ext = Path(name).suffix.encode()
+        keep = _MAX_NAME_BYTES - len(ext)
+        if keep > 0:
+            raw = raw[:len(raw) - len(ext)][:keep] + ext
+        name = raw[:_MAX_NAME_BYTES].decode(errors="ignore")
     return name or "unnamed"
 
 
 def _json_resp(status: int, data: dict) -> Response:
-    return Response(status, content=json.dumps(data))
+    return Response(status, content=orjson.dumps(data))
 
 
-def _parse_multipart(body: bytes, content_type: str) -> tuple[str, bytes] | None:
+def _to_starlette(resp: Response) -> StarletteResponse:
+    return StarletteResponse(resp.content, resp.status_code)
+
+
+def _multipart_boundary(content_type: str) -> bytes | None:
     m = re.search(r'boundary=([^\s;]+)', content_type)
     if not m:
         return None
     boundary = m.group(1).encode()
     if boundary.startswith(b'"') and boundary.endswith(b'"'):
         boundary = boundary[1:-1]
+    return boundary
+
+
+def _part_filename(headers_raw: str) -> str:
+    fn_match = re.search(r'filename="([^"]*)"', headers_raw)
+    if not fn_match:
+        fn_match = re.search(r"filename=(\S+)", headers_raw)
+    return fn_match.group(1) if fn_match else "unnamed"
+
+
+def _parse_multipart(body: bytes, content_type: str) -> tuple[str, memoryview] | None:
+    boundary = _multipart_boundary(content_type)
+    if not boundary:
+        return None
 
     delimiter = b"--" + boundary
-    parts = body.split(delimiter)
+    view = memoryview(body)
+    pos = body.find(delimiter)
 
-    for part in parts:
-        if not part or part == b"--\r\n" or part == b"--":
-            continue
-        header_end = part.find(b"\r\n\r\n")
-        if header_end < 0:
-            continue
-        headers_raw = part[:header_end].decode("utf-8", errors="replace")
-        file_data = part[header_end + 4:]
-        if file_data.endswith(b"\r\n"):
-            file_data = file_data[:-2]
+    while pos >= 0:
+        start = pos + len(delimiter)
+        end = body.find(delimiter, start)
+        if end < 0:
+            end = len(body)
 
-        if "filename=" not in headers_raw:
-            continue
+        header_end = body.find(b"\r\n\r\n", start, end)
+        if header_end >= 0:
+            headers_raw = body[start:header_end].decode("utf-8", errors="replace")
+            if "filename=" in headers_raw:
+                data_end = end
+                if body.startswith(b"\r\n", data_end - 2, data_end):
+                    data_end -= 2
+
+                return _part_filename(headers_raw), view[header_end + 4:data_end]
 
-        fn_match = re.search(r'filename="([^"]*)"', headers_raw)
-        if not fn_match:
-            fn_match = re.search(r"filename=(\S+)", headers_raw)
-        filename = fn_match.group(1) if fn_match else "unnamed"
-        return filename, file_data
+        if end >= len(body):
+            break
+        pos = end
 
     return None
 
 
+class _StreamBuffer:
+    __slots__ = ("buf", "_it")
+
+    def __init__(self, stream: AsyncIterator[bytes]):
+        # The leading CRLF lets the first delimiter match like the others.
+        self.buf = bytearray(b"\r\n")
+        self._it = aiter(stream)
+
+    async def fill(self) -> bool:
+        try:
+            self.buf += await anext(self._it)
+        except StopAsyncIteration:
+            return False
+        return True
+
+
+async def _stream_multipart(
+        stream: AsyncIterator[bytes], boundary: bytes
+) -> tuple[str, AsyncIterator[bytes]] | None:
+    delimiter = b"\r\n--" + boundary
+    sb = _StreamBuffer(stream)
+    buf = sb.buf
+
+    while True:
+        idx = buf.find(delimiter)
+        if idx < 0:
+            del buf[:max(len(buf) - len(delimiter) + 1, 0)]
+            if not await sb.fill():
+                return None
+            continue
+        del buf[:idx + len(delimiter)]
+
+        while (header_end := buf.find(b"\r\n\r\n")) < 0:
+            if len(buf) > _MAX_PART_HEADER or not await sb.fill():
+                return None
+        if buf.startswith(b"--"):
+            return None
+        headers_raw = buf[:header_end].decode("utf-8", errors="replace")
+        del buf[:header_end + 4]
+        if "filename=" in headers_raw:
+            return _part_filename(headers_raw), _stream_part_body(sb, delimiter)
+
+
+async def _stream_part_body(
+        sb: _StreamBuffer, delimiter: bytes) -> AsyncIterator[bytes]:
+    buf = sb.buf
+    keep = len(delimiter) - 1
+    while True:
+        idx = buf.find(delimiter)
+        if idx >= 0:
+            if idx:
+                yield bytes(buf[:idx])
+            return
+        if len(buf) > keep:
+            yield bytes(buf[:-keep])
+            del buf[:-keep]
+        if not await sb.fill():
+            if buf:
+                yield bytes(buf)
+            return
+
+
 async def _handle_upload(request: Request) -> Response:
     cfg = get_config()
 
@@ -163,32 +286,97 @@ async def _handle_upload(request: Request) -> Response:
     if len(content) > max_bytes:
         return _json_resp(413, {"error": f"file too large: {len(content)} > {max_bytes}"})
 
-    sha256 = hashlib.sha256(content).hexdigest()
     file_id = uuid.uuid4().hex[:16]
     save_path = cfg.upload_path / filename
 
+    hasher = hashlib.sha256()
+    view = memoryview(content)
     async with aiofiles.open(save_path, "wb") as f:
-        await f.write(content)
+        for offset in range(0, len(view), _WRITE_CHUNK_SIZE):
+            chunk = view[offset:offset + _WRITE_CHUNK_SIZE]
+            hasher.update(chunk)
+            await f.write(chunk)
+    sha256 = hasher.hexdigest()
+
+    return _register_upload(file_id, filename, save_path, len(content), sha256)
+
+
+async def _handle_upload_stream(request: StarletteRequest) -> StarletteResponse:
+    cfg = get_config()
+
+    if not _check_auth(request):
+        return _to_starlette(_json_resp(401, {"error": "unauthorized"}))
+
+    ct = request.headers.get("content-type", "")
+    chunks: AsyncIterator[bytes] = request.stream()
 
+    if "multipart/form-data" in ct:
+        boundary = _multipart_boundary(ct)
+        parsed = boundary and await _stream_multipart(chunks, boundary)
+        if not parsed:
+            return _to_starlette(_json_resp(
+                400, {"error": "failed to parse multipart"}))
+        filename, chunks = parsed
+    else:
+        filename = request.headers.get("x-file-name", "unnamed")
+
+    filename = safe_filename(filename)
+
+    if not _check_extension(filename):
+        return _to_starlette(_json_resp(403, {
+            "error": f"extension not allowed: {Path(filename).suffix}",
+            "allowed": cfg.l4d2_bot_allowed_extensions}))
+
+    max_bytes = cfg.l4d2_bot_upload_max_mb * 1024 * 1024
+    file_id = uuid.uuid4().hex[:16]
+    save_path = cfg.upload_path / filename
+    incoming = cfg.upload_path / ".incoming"
+    incoming.mkdir(parents=True, exist_ok=True)
+    tmp_path = incoming / f"{file_id}.part"
+
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    return _to_starlette(_json_resp(
+                        413, {"error": f"file too large: > {max_bytes}"}))
+                hasher.update(chunk)
+                await f.write(chunk)
+
+        if not size and "multipart/form-data" not in ct:
+            return _to_starlette(_json_resp(400, {"error": "empty body"}))
+        os.replace(tmp_path, save_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return _to_starlette(_register_upload(
+        file_id, filename, save_path, size, hasher.hexdigest()))
+
+
+def _register_upload(
+        file_id: str, filename: str, save_path: Path,
+        size: int, sha256: str) -> Response:
     meta = {
         "file_id": file_id, "file_name": filename,
-        "size": len(content), "sha256": sha256,
+        "size": size, "sha256": sha256,
         "path": str(save_path),
     }
     register_file(file_id, meta)
-    logger.info(f"文件已上传: {filename} ({len(content)} bytes, id={file_id})")
+    logger.info(f"文件已上传: {filename} ({size} bytes, id={file_id})")
 
-    return Response(200, content=json.dumps(meta))
+    return _json_resp(200, meta)
 
 
-async def _handle_download(request: Request) -> Response:
+def _locate_download(request) -> Response | tuple[str, dict, Path]:
     cfg = get_config()
 
     if not _check_auth(request):
         return _json_resp(401, {"error": "unauthorized"})
 
-    qs = parse_qs(urlparse(str(request.url)).query)
-    file_id = qs.get("file_id", [""])[0]
+    file_id = _query_param(request, "file_id")
 
     if not file_id:
         return _json_resp(400, {"error": "missing file_id parameter"})
@@ -205,6 +393,24 @@ async def _handle_download(request: Request) -> Response:
     if not file_path.exists():
         return _json_resp(404, {"error": "file missing on disk"})
 
+    return file_id, meta, file_path
+
+
+def _release_download(file_id: str, file_path: Path, safe_name: str):
+    try:
+        file_path.unlink(missing_ok=True)
+        _unregister_file(file_id)
+        logger.info(f"文件已清理: {safe_name} (id={file_id})")
+    except Exception as e:
+        logger.warning(f"文件清理失败: {e}")
+
+
+async def _handle_download(request: Request) -> Response:
+    located = _locate_download(request)
+    if isinstance(located, Response):
+        return located
+    file_id, meta, file_path = located
+
     async with aiofiles.open(file_path, "rb") as f:
         content = await f.read()
 
@@ -215,23 +421,61 @@ async def _handle_download(request: Request) -> Response:
         "X-File-SHA256": meta["sha256"],
     }, content=content)
 
-    try:
-        file_path.unlink(missing_ok=True)
-        _file_registry.pop(file_id, None)
-        logger.info(f"文件已清理: {safe_name} (id={file_id})")
-    except Exception as e:
-        logger.warning(f"文件清理失败: {e}")
-
+    _release_download(file_id, file_path, safe_name)
     return resp
 
 
+async def _handle_download_stream(request: StarletteRequest) -> StarletteResponse:
+    # Starlette answers HEAD on GET routes; downloads are one-shot, so keep
+    # the GET-only contract instead of letting a HEAD consume the file.
+    if request.method != "GET":
+        return StarletteResponse(
+            orjson.dumps({"error": "method not allowed"}), 405,
+            headers={"Allow": "GET"})
+
+    located = _locate_download(request)
+    if isinstance(located, Response):
+        return _to_starlette(located)
+    file_id, meta, file_path = located
+
+    # Range requests may be answered with a partial body; the file is only
+    # released once a response reaches its end.
+    safe_name = safe_filename(meta["file_name"])
+    background = None
+    range_header = request.headers.get("range")
+    if range_header is None or _range_reaches_eof(
+            range_header, file_path.stat().st_size):
+        background = BackgroundTask(
+            _release_download, file_id, file_path, safe_name)
+    return FileResponse(
+        file_path, filename=safe_name,
+        media_type="application/octet-stream",
+        headers={"X-File-SHA256": meta["sha256"]},
+        background=background,
+    )
+
+
+def _range_reaches_eof(range_header: str, size: int) -> bool:
+    m = _RANGE_RE.fullmatch(range_header.strip())
+    if not m:
+        return False
+    start, end = m.groups()
+    if not start:
+        return bool(end) and int(end) > 0
+    if int(start) >= size:
+        return False
+    return not end or int(end) >= size - 1
+
+
 async def _handle_list(request: Request) -> Response:
+    global _list_cache
     if not _check_auth(request):
         return _json_resp(401, {"error": "unauthorized"})
 
-    file_list = [
-        {"file_id": fid, "file_name": m.get("file_name", ""),
-         "size": m.get("size", 0), "sha256": m.get("sha256", "")}
-        for fid, m in _file_registry.items()
-    ]
-    return Response(200, content=json.dumps({"files": file_list}))
+    if _list_cache is None:
+        _list_cache = orjson.dumps({"files": [
+            {"file_id": fid, "file_name": m.get("file_name", ""),
+             "size": m.get("size", 0), "sha256": m.get("sha256", "")}
+            for fid, m in _file_registry.items()
+        ]})
+    return Response(200, content=_list_cache)
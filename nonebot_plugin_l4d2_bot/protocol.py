@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import functools
 import hashlib
 import hmac
+import re
+import struct
 import time
 import uuid
+from collections import deque
 from enum import IntEnum, StrEnum
 from typing import Any, Self
 
-from pydantic import BaseModel, Field
+import msgspec
 
 
 class MsgType(StrEnum):
@@ -23,6 +27,12 @@ class MsgType(StrEnum):
     ERROR = "something_wrong"
 
 
+# RESULT payload: ok (bool, or "true"/"1"), file_name, size_mb, speed,
+# err_msg, extracted (bool, or "true"/"1"), extract_time. size_mb, speed
+# and extract_time may be numbers or preformatted strings and are passed
+# to result handlers untouched; they are only formatted for display.
+
+
 class ErrCode(IntEnum):
     OK = 0
     AUTH_FAILED = 1001
@@ -36,27 +46,67 @@ class ErrCode(IntEnum):
     INTERNAL = 5000
 
 
-class BridgePacket(BaseModel):
+# Binary FILE_CHUNK frame: transfer_id (16 bytes, NUL padded), chunk_index,
+# total_chunks, then the raw chunk bytes. Only valid for transfers already
+# opened by a signed JSON FILE_CHUNK on the same connection.
+BIN_CHUNK_HEADER = struct.Struct("<16sII")
+
+
+_SIG_HEX_LEN = hashlib.sha256().digest_size * 2
+
+
+@functools.lru_cache(maxsize=8)
+def _hmac_template(secret: str) -> hmac.HMAC:
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+
+def _hmac_hex(secret: str, raw: str) -> str:
+    h = _hmac_template(secret).copy()
+    h.update(raw.encode())
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=16)
+def _hmac_prefixed(secret: str, prefix: str) -> hmac.HMAC:
+    h = _hmac_template(secret).copy()
+    h.update(prefix.encode())
+    return h
+
+
+def _frame_sig(secret: str, msg_type: MsgType, msg_id: str, ts: int) -> str:
+    h = _hmac_prefixed(secret, f"1|{msg_type}|").copy()
+    h.update(f"{msg_id}|bridge|{ts}|".encode())
+    return h.hexdigest()
+
+
+class BridgePacket(msgspec.Struct, kw_only=True):
     v: int = 1
     type: MsgType
-    msg_id: str = Field(default_factory=lambda: uuid.uuid4().hex[:16])
+    msg_id: str = msgspec.field(default_factory=lambda: uuid.uuid4().hex[:16])
     server_id: str = ""
-    ts: int = Field(default_factory=lambda: int(time.time()))
+    ts: int = msgspec.field(default_factory=lambda: int(time.time()))
     channel: str = ""
-    payload: dict[str, Any] = Field(default_factory=dict)
+    payload: dict[str, Any] = msgspec.field(default_factory=dict)
     sig: str = ""
 
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> BridgePacket:
+        return _decoder.decode(raw)
+
+    def to_json(self) -> str:
+        return _encoder.encode(self).decode()
+
     def compute_sig(self, secret: str) -> str:
         raw = f"{self.v}|{self.type}|{self.msg_id}|{self.server_id}|{self.ts}|{self.channel}"
-        return hmac.new(
-            secret.encode(), raw.encode(), hashlib.sha256
-        ).hexdigest()
+        return _hmac_hex(secret, raw)
 
     def sign(self, secret: str) -> Self:
         self.sig = self.compute_sig(secret)
         return self
 
     def verify_sig(self, secret: str) -> bool:
+        if len(self.sig) != _SIG_HEX_LEN:
+            return False
         expected = self.compute_sig(secret)
         return hmac.compare_digest(self.sig, expected)
 
@@ -64,11 +114,15 @@ class BridgePacket(BaseModel):
         return abs(time.time() - self.ts) <= window_sec
 
 
+_encoder = msgspec.json.Encoder()
+_decoder = msgspec.json.Decoder(BridgePacket, strict=False)
+
+
 def make_hello_ack(server_id: str, secret: str) -> BridgePacket:
     return BridgePacket(
         type=MsgType.HELLO_ACK,
         server_id="bridge",
-        payload={"accepted_server": server_id},
+        payload={"accepted_server": server_id, "binary_chunks": True},
     ).sign(secret)
 
 
@@ -76,6 +130,19 @@ def make_pong(secret: str) -> BridgePacket:
     return BridgePacket(type=MsgType.PONG, server_id="bridge").sign(secret)
 
 
+_PONG_FRAME = (
+    '{"v":1,"type":"' + MsgType.PONG + '","msg_id":"%s","server_id":"bridge",'
+    '"ts":%d,"channel":"","payload":{},"sig":"%s"}'
+)
+
+
+def make_pong_frame(secret: str) -> str:
+    msg_id = uuid.uuid4().hex[:16]
+    ts = int(time.time())
+    sig = _frame_sig(secret, MsgType.PONG, msg_id, ts)
+    return _PONG_FRAME % (msg_id, ts, sig)
+
+
 def make_file_in_notice(
         channel: str, file_name: str, secret: str,
         url: str = "", file_id: str = "",
@@ -105,6 +172,19 @@ def make_ack(ref_msg_id: str, secret: str) -> BridgePacket:
     ).sign(secret)
 
 
+_ACK_FRAME = (
+    '{"v":1,"type":"' + MsgType.ACK + '","msg_id":"%s","server_id":"bridge",'
+    '"ts":%d,"channel":"","payload":{"ref_msg_id":%s},"sig":"%s"}'
+)
+
+
+def make_ack_frame(ref_msg_id: str, secret: str) -> str:
+    msg_id = uuid.uuid4().hex[:16]
+    ts = int(time.time())
+    sig = _frame_sig(secret, MsgType.ACK, msg_id, ts)
+    return _ACK_FRAME % (msg_id, ts, _encoder.encode(ref_msg_id).decode(), sig)
+
+
 def make_error(
         code: ErrCode, msg: str, secret: str,
         ref_msg_id: str = "") -> BridgePacket:
@@ -115,20 +195,33 @@ def make_error(
     ).sign(secret)
 
 
+_MSG_ID_RE = re.compile(r"[0-9a-f]{16}")
+
+
+def msg_key(msg_id: str) -> int | str:
+    # Only canonical ids are packed into ints; int() would also accept
+    # "0x", "_", signs and leading zeros and fold distinct ids together.
+    if _MSG_ID_RE.fullmatch(msg_id):
+        return int(msg_id, 16)
+    return msg_id
+
+
 class DedupWindow:
-    __slots__ = ("_window", "_seen")
+    __slots__ = ("_window", "_max_size", "_ids", "_q")
 
-    def __init__(self, window_sec: int = 600):
+    def __init__(self, window_sec: int = 600, max_size: int = 100_000):
         self._window = window_sec
-        self._seen: dict[str, float] = {}
-
-    def is_dup(self, msg_id: str) -> bool:
-        now = time.time()
-        self._seen = {
-            k: t for k, t in self._seen.items()
-            if now - t <= self._window
-        }
-        if msg_id in self._seen:
+        self._max_size = max_size
+        self._ids: set[int | str] = set()
+        self._q: deque[tuple[int | str, float]] = deque()
+
+    def is_dup(self, key: int | str) -> bool:
+        now = time.monotonic()
+        q, ids = self._q, self._ids
+        while q and (now - q[0][1] > self._window or len(q) >= self._max_size):
+            ids.discard(q.popleft()[0])
+        if key in ids:
             return True
-        self._seen[msg_id] = now
+        ids.add(key)
+        q.append((key, now))
         return False
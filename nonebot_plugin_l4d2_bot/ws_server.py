@@ -1,15 +1,17 @@
 from __future__ import annotations
 
 import asyncio
-import base64
+import binascii
 import contextlib
 import hashlib
 import hmac
-import re
+import os
 import time
+import uuid
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import BinaryIO
 
 import nonebot
 from nonebot import get_driver
@@ -17,60 +19,150 @@ from nonebot.adapters.onebot.v11 import Message
 from nonebot.drivers import ASGIMixin, WebSocketServerSetup, WebSocket
 from starlette.requests import URL
 
-from .config import get_config
+from .config import BridgeConfig, get_config
 from nonebot.log import logger
-from .connection import conn_mgr
+from .connection import GameServerConn, conn_mgr
 from .protocol import (
-    BridgePacket, MsgType, ErrCode, DedupWindow,
-    make_hello_ack, make_pong, make_ack, make_error,
+    BIN_CHUNK_HEADER, BridgePacket, MsgType, ErrCode, DedupWindow, msg_key,
+    make_hello_ack, make_pong_frame, make_ack_frame, make_error,
 )
 from .http_server import register_file, safe_filename
 
 _MAX_CONNECTIONS = 16
-_SERVER_ID_RE = re.compile(r'^[\w.\-]{1,64}$')
+_NOTIFY_BATCH = 10
+_SERVER_ID_TABLE = str.maketrans({
+    c: "_" for c in map(chr, range(128))
+    if not (c.isalnum() or c in "_.-")})
 
 _dedup = DedupWindow()
 
+# Binary chunk frames start with an ASCII transfer_id, never with JSON's
+# opening brace or leading whitespace.
+_JSON_LEAD = b"{ \t\r\n"
+
+# ACK/PONG on an already authenticated connection skip HMAC verification:
+# they only log or refresh the heartbeat and never trigger file or group
+# actions. Injecting one requires access to the established WebSocket
+# itself, at which point signatures on these types protect nothing.
+_UNSIGNED_TYPES = frozenset({MsgType.ACK, MsgType.PONG})
+# Unsigned packets must not be able to fill the shared dedup window.
+_NO_DEDUP_TYPES = _UNSIGNED_TYPES | {MsgType.PING}
+
 FileOutHandler = Callable[..., Awaitable[None]]
+# Result handlers are called as (server_id, ok: bool, file_name, size_mb,
+# speed, err_msg, extracted: bool, extract_time, channel). extracted used
+# to be the raw payload value (usually a "true"/"false" string) and is now
+# a bool. size_mb, speed and extract_time are no longer coerced to str and
+# may be numbers; handlers format them for display themselves.
 ResultHandler = Callable[..., Awaitable[None]]
 
 _file_out_handlers: list[FileOutHandler] = []
 _result_handlers: list[ResultHandler] = []
 
 
+def _safe_handler(func: Callable[..., Awaitable[None]]):
+    async def wrapper(*args):
+        try:
+            await func(*args)
+        except Exception as e:
+            logger.error(f"处理器异常: {e}")
+    return wrapper
+
+
 def on_file_out(func: FileOutHandler) -> FileOutHandler:
-    _file_out_handlers.append(func)
+    _file_out_handlers.append(_safe_handler(func))
     return func
 
 
 def on_result(func: ResultHandler) -> ResultHandler:
-    _result_handlers.append(func)
+    _result_handlers.append(_safe_handler(func))
     return func
 
 
 @dataclass(slots=True)
 class _ChunkedTransfer:
+    server_id: str
     total_chunks: int
     file_name: str
     total_size: int
     sha256: str
     channel: str
-    received: set[int] = field(default_factory=set)
-    data: bytearray = field(default_factory=bytearray)
-    created_at: float = field(default_factory=time.time)
+    tmp_path: Path
+    fp: BinaryIO
+    chunk_size: int = 0
+    received: bytearray = field(init=False)
+    received_count: int = 0
+    length: int = 0
+    hasher: hashlib._Hash = field(default_factory=hashlib.sha256)
+    hashed_chunks: int = 0
+    hashed_length: int = 0
+    pending: dict[int, tuple[bytes, bool]] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.received = bytearray((self.total_chunks + 7) >> 3)
+
+    def has_chunk(self, chunk_index: int) -> bool:
+        return bool(self.received[chunk_index >> 3] & (1 << (chunk_index & 7)))
+
+    def mark_chunk(self, chunk_index: int):
+        self.received[chunk_index >> 3] |= 1 << (chunk_index & 7)
+        self.received_count += 1
+
+    def hash_chunk(self, chunk_index: int, decoded: bytes, written: bool):
+        if chunk_index != self.hashed_chunks:
+            self.pending[chunk_index] = (decoded, written)
+            return
+        self._advance(decoded, written)
+        while (nxt := self.pending.pop(self.hashed_chunks, None)) is not None:
+            self._advance(*nxt)
+
+    def _advance(self, decoded: bytes, written: bool):
+        # Chunks that could not be placed on arrival are written once the
+        # in-order prefix reaches them.
+        if not written:
+            self.write_chunk(self.hashed_length, decoded)
+        self.hasher.update(decoded)
+        self.hashed_chunks += 1
+        self.hashed_length += len(decoded)
+
+    def write_chunk(self, offset: int, decoded: bytes):
+        self.fp.seek(offset)
+        self.fp.write(decoded)
+        self.length = max(self.length, offset + len(decoded))
+
+    def discard(self):
+        self.fp.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+    def offset_of(self, chunk_index: int, size: int) -> int | None:
+        if not self.chunk_size and chunk_index < self.total_chunks - 1:
+            self.chunk_size = size
+        if chunk_index == self.hashed_chunks:
+            return self.hashed_length
+        if self.chunk_size:
+            return chunk_index * self.chunk_size
+        return None
 
 _transfers: dict[str, _ChunkedTransfer] = {}
 _TRANSFER_TIMEOUT = 300
+_TRANSFER_CLEANUP_INTERVAL = 30
+_MAX_TOTAL_CHUNKS = 1 << 20
+_last_transfer_cleanup = 0.0
 
 
 def _cleanup_stale_transfers():
-    now = time.time()
+    global _last_transfer_cleanup
+    now = time.monotonic()
+    if now - _last_transfer_cleanup < _TRANSFER_CLEANUP_INTERVAL:
+        return
+    _last_transfer_cleanup = now
     for tid in [
         k for k, v in _transfers.items()
         if now - v.created_at > _TRANSFER_TIMEOUT
     ]:
         logger.warning(f"清理超时分块传输: {tid}")
-        del _transfers[tid]
+        _transfers.pop(tid).discard()
 
 
 def setup_ws_server():
@@ -99,21 +191,25 @@ async def _handle_ws(ws: WebSocket):
         return
 
     await ws.accept()
+    cfg = get_config()
     server_id = ""
     try:
-        server_id = await _do_handshake(ws)
+        server_id, hello = await _do_handshake(ws, cfg)
         if not server_id:
             return
 
         conn = conn_mgr.add(server_id, ws)
+        conn.batch = hello.get("batch") is True
         conn.authenticated = True
 
-        heartbeat_task = asyncio.create_task(_heartbeat_monitor(server_id))
+        heartbeat_task = asyncio.create_task(
+            _heartbeat_monitor(server_id, cfg))
         try:
-            await _message_loop(ws, server_id)
+            await _message_loop(ws, server_id, conn, cfg)
         finally:
             heartbeat_task.cancel()
-            conn_mgr.remove(server_id)
+            if conn_mgr.get(server_id) is conn:
+                conn_mgr.remove(server_id)
     except Exception as e:
         logger.error(f"WebSocket 异常 ({server_id}): {e}")
     finally:
@@ -121,179 +217,290 @@ async def _handle_ws(ws: WebSocket):
             await ws.close()
 
 
-async def _do_handshake(ws: WebSocket) -> str:
-    cfg = get_config()
+async def _do_handshake(
+        ws: WebSocket, cfg: BridgeConfig) -> tuple[str, dict]:
     token = cfg.l4d2_bot_token
 
     try:
         data = await asyncio.wait_for(ws.receive(), timeout=10)
-        raw = data if isinstance(data, str) else data.decode("utf-8")
     except asyncio.TimeoutError:
         logger.warning(f"握手超时")
-        return ""
+        return "", {}
 
     try:
-        pkt = BridgePacket.model_validate_json(raw)
-    except Exception:
+        pkt = BridgePacket.from_json(data)
+    except ValueError:
         logger.warning(f"握手包解析失败")
-        return ""
+        return "", {}
 
     if pkt.type != MsgType.HELLO:
         await _send(ws, make_error(ErrCode.AUTH_FAILED, "期望 hello", token))
-        return ""
+        return "", {}
 
     token_in = pkt.payload.get("token", "")
     if not hmac.compare_digest(token_in, token):
         await _send(ws, make_error(ErrCode.AUTH_FAILED, "token 错误", token))
-        return ""
+        return "", {}
 
     if not pkt.verify_sig(token):
         await _send(ws, make_error(ErrCode.INVALID_SIG, "签名校验失败", token))
-        return ""
+        return "", {}
 
     if not pkt.verify_ts(cfg.l4d2_bot_hmac_window_sec):
         await _send(ws, make_error(ErrCode.EXPIRED, "时间戳过期", token))
-        return ""
+        return "", {}
 
     server_id = pkt.server_id or "unknown"
-    if not _SERVER_ID_RE.match(server_id):
-        server_id = re.sub(r'[^\w.\-]', '_', server_id)[:64] or "unknown"
+    if server_id.isascii():
+        server_id = server_id.translate(_SERVER_ID_TABLE)[:64]
+    else:
+        server_id = "".join(
+            c if c.isalnum() or c in "_.-" else "_" for c in server_id)[:64]
 
     await _send(ws, make_hello_ack(server_id, token))
     logger.info(f"认证成功: {server_id}")
-    return server_id
+    return server_id, pkt.payload
 
 
-async def _message_loop(ws: WebSocket, server_id: str):
-    token = get_config().l4d2_bot_token
+async def _message_loop(
+        ws: WebSocket, server_id: str, conn: GameServerConn,
+        cfg: BridgeConfig):
+    token = cfg.l4d2_bot_token
 
     while True:
         try:
             data = await ws.receive()
-            raw = data if isinstance(data, str) else data.decode("utf-8")
         except Exception:
             logger.info(f"连接关闭: {server_id}")
             break
 
+        if isinstance(data, bytes) and data[:1] not in _JSON_LEAD:
+            conn.last_ping = time.monotonic()
+            await _handle_binary_chunk(server_id, data, cfg)
+            continue
+
         try:
-            pkt = BridgePacket.model_validate_json(raw)
-        except Exception as e:
+            pkt = BridgePacket.from_json(data)
+        except ValueError as e:
             logger.warning(f"数据包解析失败 ({server_id}): {e}")
             continue
 
-        if not pkt.verify_sig(token):
-            await _send(ws, make_error(
-                ErrCode.INVALID_SIG, "签名错误", token, pkt.msg_id))
+        if pkt.type not in _UNSIGNED_TYPES and not pkt.verify_sig(token):
+            _reply(conn, make_error(
+                ErrCode.INVALID_SIG, "签名错误", token, pkt.msg_id).to_json())
             continue
 
-        if pkt.type not in (MsgType.PING, MsgType.ACK) and _dedup.is_dup(pkt.msg_id):
+        if pkt.type not in _NO_DEDUP_TYPES and _dedup.is_dup(msg_key(pkt.msg_id)):
             logger.debug(f"重复消息已跳过: {pkt.msg_id}")
-            await _send(ws, make_ack(pkt.msg_id, token))
+            _reply(conn, make_ack_frame(pkt.msg_id, token))
             continue
 
-        conn = conn_mgr.get(server_id)
-        if conn:
-            conn.last_ping = time.time()
+        conn.last_ping = time.monotonic()
+        await _dispatch(conn, server_id, pkt, cfg, token)
+
+
+async def _dispatch(
+        conn: GameServerConn, server_id: str, pkt: BridgePacket,
+        cfg: BridgeConfig, token: str):
+    await _DISPATCH.get(pkt.type, _on_unknown)(
+        conn, server_id, pkt, cfg, token)
 
-        await _dispatch(ws, server_id, pkt)
 
+async def _on_ping(
+        conn: GameServerConn, server_id: str, pkt: BridgePacket,
+        cfg: BridgeConfig, token: str):
+    _reply(conn, make_pong_frame(token))
 
-async def _dispatch(ws: WebSocket, server_id: str, pkt: BridgePacket):
-    token = get_config().l4d2_bot_token
+
+async def _on_file_out(
+        conn: GameServerConn, server_id: str, pkt: BridgePacket,
+        cfg: BridgeConfig, token: str):
     p = pkt.payload
+    _reply(conn, make_ack_frame(pkt.msg_id, token))
+    await _invoke_handlers(_file_out_handlers,
+        server_id, pkt.channel, p.get("file_id", ""),
+        p.get("file_name", ""), int(p.get("size", 0)),
+        p.get("sha256", ""), p.get("url", ""), p.get("data", ""))
+
+
+async def _on_file_chunk(
+        conn: GameServerConn, server_id: str, pkt: BridgePacket,
+        cfg: BridgeConfig, token: str):
+    if pkt.payload.get("transfer_id", "") not in _transfers and (
+            rejected := _check_transfer_limits(pkt.payload, cfg)):
+        code, reason = rejected
+        if int(pkt.payload.get("chunk_index", 0)) == 0:
+            logger.warning(f"拒绝分块传输 ({server_id}): {reason}")
+        _reply(conn, make_error(code, reason, token, pkt.msg_id).to_json())
+        return
+    _reply(conn, make_ack_frame(pkt.msg_id, token))
+    await _handle_file_chunk(server_id, pkt.channel, pkt.payload, cfg)
+
+
+async def _on_result(
+        conn: GameServerConn, server_id: str, pkt: BridgePacket,
+        cfg: BridgeConfig, token: str):
+    p = pkt.payload
+    await _invoke_handlers(_result_handlers,
+        server_id,
+        _is_true(p.get("ok")),
+        p.get("file_name", ""),
+        p.get("size_mb", ""),
+        p.get("speed", ""),
+        p.get("err_msg", ""),
+        _is_true(p.get("extracted")),
+        p.get("extract_time", ""),
+        pkt.channel or "")
+
 
-    match pkt.type:
-        case MsgType.PING:
-            await _send(ws, make_pong(token))
+async def _on_ack(
+        conn: GameServerConn, server_id: str, pkt: BridgePacket,
+        cfg: BridgeConfig, token: str):
+    logger.debug(f"收到 ACK ({server_id}): {pkt.payload.get('ref_msg_id')}")
 
-        case MsgType.FILE_OUT:
-            await _send(ws, make_ack(pkt.msg_id, token))
-            await _invoke_handlers(_file_out_handlers,
-                server_id, pkt.channel, p.get("file_id", ""),
-                p.get("file_name", ""), int(p.get("size", 0)),
-                p.get("sha256", ""), p.get("url", ""), p.get("data", ""))
 
-        case MsgType.FILE_CHUNK:
-            await _send(ws, make_ack(pkt.msg_id, token))
-            await _handle_file_chunk(server_id, pkt.channel, p)
+async def _on_unknown(
+        conn: GameServerConn, server_id: str, pkt: BridgePacket,
+        cfg: BridgeConfig, token: str):
+    logger.warning(f"未知消息类型: {pkt.type} ({server_id})")
 
-        case MsgType.RESULT:
-            await _invoke_handlers(_result_handlers,
-                server_id,
-                str(p.get("ok", "false")) in ("true", "1"),
-                p.get("file_name", ""),
-                str(p.get("size_mb", "")),
-                str(p.get("speed", "")),
-                p.get("err_msg", ""),
-                p.get("extracted", ""),
-                str(p.get("extract_time", "")),
-                pkt.channel or "")
 
-        case MsgType.ACK:
-            logger.debug(f"收到 ACK ({server_id}): {p.get('ref_msg_id')}")
+_DISPATCH: dict[str, Callable[..., Awaitable[None]]] = {
+    MsgType.PING: _on_ping,
+    MsgType.FILE_OUT: _on_file_out,
+    MsgType.FILE_CHUNK: _on_file_chunk,
+    MsgType.RESULT: _on_result,
+    MsgType.ACK: _on_ack,
+}
 
-        case _:
-            logger.warning(f"未知消息类型: {pkt.type} ({server_id})")
+
+def _is_true(v) -> bool:
+    return v is True or v == 1 or v == "true" or v == "1"
 
 
 async def _invoke_handlers(handlers: list, *args):
-    for handler in handlers:
-        try:
-            await handler(*args)
-        except Exception as e:
-            logger.error(f"处理器异常: {e}")
+    if len(handlers) == 1:
+        await handlers[0](*args)
+    elif handlers:
+        await asyncio.gather(*(h(*args) for h in handlers))
+
+
+def _check_transfer_limits(
+        p: dict, cfg: BridgeConfig) -> tuple[ErrCode, str] | None:
+    # total_chunks sizes the received bitmap, so bound it by what the
+    # declared (or maximum allowed) file size could hold.
+    total_size   = int(p.get("total_size", 0))
+    total_chunks = max(int(p.get("total_chunks", 1)), 1)
+    max_bytes = cfg.l4d2_bot_upload_max_mb * 1024 * 1024
+    if total_size > max_bytes:
+        return ErrCode.FILE_TOO_LARGE, f"文件过大: {total_size} > {max_bytes}"
+    chunk_cap = min(_MAX_TOTAL_CHUNKS, max(total_size, 1) if total_size
+                    else max_bytes)
+    if total_chunks > chunk_cap:
+        return ErrCode.INVALID_PAYLOAD, f"分块数无效: {total_chunks} > {chunk_cap}"
+    return None
 
 
 async def _handle_file_chunk(
-        server_id: str, channel: str, p: dict):
+        server_id: str, channel: str, p: dict, cfg: BridgeConfig):
     _cleanup_stale_transfers()
     transfer_id  = p.get("transfer_id", "")
     file_name    = p.get("file_name", "")
     total_size   = int(p.get("total_size", 0))
     sha256       = p.get("sha256", "")
     chunk_index  = int(p.get("chunk_index", 0))
-    total_chunks = int(p.get("total_chunks", 1))
+    total_chunks = max(int(p.get("total_chunks", 1)), 1)
+    chunk_size   = int(p.get("chunk_size", 0))
     chunk_data   = p.get("data", "")
 
-    if transfer_id not in _transfers:
-        _transfers[transfer_id] = _ChunkedTransfer(
-            total_chunks, file_name, total_size, sha256, channel)
+    xfer = _transfers.get(transfer_id)
+    if xfer is None:
+        incoming = cfg.upload_path / ".incoming"
+        incoming.mkdir(parents=True, exist_ok=True)
+        tmp_path = incoming / f"{uuid.uuid4().hex}.part"
+        xfer = _transfers[transfer_id] = _ChunkedTransfer(
+            server_id, total_chunks, file_name, total_size, sha256, channel,
+            tmp_path, open(tmp_path, "wb"), chunk_size)
         logger.info(f"开始接收分块文件: {file_name} "
                    f"({total_size} bytes, {total_chunks} 块)")
-        await _notify_upload_start(server_id, channel, file_name)
+        await _notify_upload_start(server_id, channel, file_name, cfg)
+
+    try:
+        decoded = binascii.a2b_base64(chunk_data, strict_mode=False)
+    except Exception as e:
+        logger.error(f"分块解码失败 ({transfer_id} #{chunk_index}): {e}")
+    else:
+        await _store_chunk(
+            server_id, transfer_id, xfer, chunk_index, decoded, cfg)
+
+
+async def _handle_binary_chunk(
+        server_id: str, data: bytes, cfg: BridgeConfig):
+    if len(data) < BIN_CHUNK_HEADER.size:
+        logger.warning(f"二进制分块过短 ({server_id}): {len(data)} bytes")
+        return
+    raw_id, chunk_index, total_chunks = BIN_CHUNK_HEADER.unpack_from(data)
+    transfer_id = raw_id.rstrip(b"\0").decode("ascii", errors="replace")
 
-    xfer = _transfers[transfer_id]
+    xfer = _transfers.get(transfer_id)
+    if (xfer is None or xfer.server_id != server_id
+            or total_chunks != xfer.total_chunks):
+        logger.warning(f"未知的二进制分块传输 ({server_id}): {transfer_id}")
+        return
+
+    await _store_chunk(server_id, transfer_id, xfer, chunk_index,
+                       memoryview(data)[BIN_CHUNK_HEADER.size:], cfg)
 
-    if chunk_index not in xfer.received:
+
+async def _store_chunk(
+        server_id: str, transfer_id: str, xfer: _ChunkedTransfer,
+        chunk_index: int, decoded: bytes | memoryview, cfg: BridgeConfig):
+    if not 0 <= chunk_index < xfer.total_chunks:
+        logger.warning(f"分块序号越界 ({transfer_id} #{chunk_index})")
+        return
+
+    if not xfer.has_chunk(chunk_index):
+        offset = xfer.offset_of(chunk_index, len(decoded))
+        if (offset is not None and xfer.total_size
+                and offset + len(decoded) > xfer.total_size):
+            logger.warning(f"分块超出文件大小 ({transfer_id} #{chunk_index})")
+            return
         try:
-            xfer.data.extend(base64.b64decode(chunk_data))
-            xfer.received.add(chunk_index)
+            if offset is not None:
+                xfer.write_chunk(offset, decoded)
+            xfer.hash_chunk(chunk_index, decoded, offset is not None)
+            xfer.mark_chunk(chunk_index)
         except Exception as e:
-            logger.error(f"分块解码失败 ({transfer_id} #{chunk_index}): {e}")
+            logger.error(f"分块写入失败 ({transfer_id} #{chunk_index}): {e}")
 
-    logger.debug(f"收到分块 {chunk_index + 1}/{total_chunks} "
+    logger.debug(f"收到分块 {chunk_index + 1}/{xfer.total_chunks} "
                 f"({transfer_id})")
 
-    if len(xfer.received) < xfer.total_chunks:
+    if xfer.received_count < xfer.total_chunks:
         return
 
+    xfer.fp.truncate(xfer.length)
+    xfer.fp.close()
     logger.info(f"分块接收完成: {xfer.file_name} "
-               f"({len(xfer.data)} bytes)")
-    actual_sha = hashlib.sha256(xfer.data).hexdigest()
+               f"({xfer.length} bytes)")
+    if xfer.hashed_chunks == xfer.total_chunks:
+        actual_sha = xfer.hasher.hexdigest()
+    else:
+        with open(xfer.tmp_path, "rb") as f:
+            actual_sha = hashlib.file_digest(f, "sha256").hexdigest()
     if xfer.sha256 and actual_sha != xfer.sha256:
         logger.warning(f"SHA256 不匹配: "
                       f"期望={xfer.sha256} 实际={actual_sha}")
 
-    cfg = get_config()
     safe_name = safe_filename(xfer.file_name)
     save_path = cfg.upload_path / (safe_name or "upload")
     save_path.parent.mkdir(parents=True, exist_ok=True)
-    save_path.write_bytes(xfer.data)
+    os.replace(xfer.tmp_path, save_path)
     logger.info(f"文件已保存: {save_path}")
 
     register_file(transfer_id, {
         "file_id": transfer_id, "file_name": xfer.file_name,
-        "size": len(xfer.data), "sha256": actual_sha,
+        "size": xfer.length, "sha256": actual_sha,
         "path": str(save_path.resolve()),
     })
 
@@ -304,15 +511,14 @@ async def _handle_file_chunk(
     del _transfers[transfer_id]
 
 
-async def _heartbeat_monitor(server_id: str):
-    cfg = get_config()
+async def _heartbeat_monitor(server_id: str, cfg: BridgeConfig):
     timeout = cfg.l4d2_bot_heartbeat_interval * 3
     while True:
         await asyncio.sleep(cfg.l4d2_bot_heartbeat_interval)
         conn = conn_mgr.get(server_id)
         if not conn:
             break
-        if time.time() - conn.last_ping > timeout:
+        if time.monotonic() - conn.last_ping > timeout:
             logger.warning(f"心跳超时，断开连接: {server_id}")
             with contextlib.suppress(Exception):
                 await conn.ws.close()
@@ -320,30 +526,38 @@ async def _heartbeat_monitor(server_id: str):
             break
 
 
+def _reply(conn: GameServerConn, raw: str):
+    if not conn.send_nowait(raw):
+        logger.warning(f"发送队列已满，丢弃回复: {conn.server_id}")
+
+
 async def _send(ws: WebSocket, pkt: BridgePacket):
     try:
-        await ws.send_text(pkt.model_dump_json())
+        await ws.send_text(pkt.to_json())
     except Exception as e:
         logger.error(f"发送失败: {e}")
 
 
 async def _notify_upload_start(
-        server_id: str, channel: str, file_name: str):
+        server_id: str, channel: str, file_name: str, cfg: BridgeConfig):
     try:
         bot = nonebot.get_bot()
     except ValueError:
         return
 
-    cfg = get_config()
     if channel and channel.startswith("qq_group:"):
         gid = channel.removeprefix("qq_group:").strip()
-        gids = [gid] if gid and gid in cfg.l4d2_bot_qq_groups else []
+        gids = [gid] if gid and gid in cfg.qq_group_set else []
     else:
         gids = list(cfg.l4d2_bot_qq_groups)
 
-    msg = f"检测到服务器上传文件: {file_name}"
-    for gid in gids:
-        try:
-            await bot.send_group_msg(group_id=int(gid), message=Message(msg))
-        except Exception as e:
-            logger.error(f"通知群 {gid} 失败: {e}")
+    msg = Message(f"检测到服务器上传文件: {file_name}")
+    for i in range(0, len(gids), _NOTIFY_BATCH):
+        batch = gids[i:i + _NOTIFY_BATCH]
+        results = await asyncio.gather(*(
+            bot.send_group_msg(group_id=int(gid), message=msg)
+            for gid in batch
+        ), return_exceptions=True)
+        for gid, result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error(f"通知群 {gid} 失败: {result}")